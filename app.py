@@ -26,8 +26,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Define persistent data directory
-PERSISTENT_DATA_DIR = '/app/persistent_data'
+# Define persistent data directory (shared with the kraken module)
+PERSISTENT_DATA_DIR = kraken.PERSISTENT_DATA_DIR
 
 def ensure_persistent_dirs():
     """Ensure all necessary directories exist in persistent data volume"""
@@ -197,48 +197,40 @@ def calculate_taxes_api():
         logger.info(f"Total number of transactions: {response['result']['count']}")
         
         # Get all ledger data
-        start_timestamp = datetime.strptime(start_date, "%Y-%m-%d")
         filename = os.path.join(PERSISTENT_DATA_DIR, "data", "kraken_ledger.parquet")
         ledger_df = pd.DataFrame([])
         
         # Read data from file
         try:
-            ledger_df = pd.read_parquet(filename, engine="fastparquet")
+            ledger_df = pd.read_parquet(filename, engine="pyarrow")
             if ledger_df.shape[0] > 0:
-                ledger_df = ledger_df[ledger_df["date"] > start_date]
+                ledger_df = ledger_df[ledger_df["date"] > pd.Timestamp(start_date)]
                 start_timestamp = ledger_df.iloc[0].loc["date"]
                 start_date = str(start_timestamp)[:10]
         except FileNotFoundError:
             logger.info("No existing ledger file found, starting fresh")
 
         ledger_df_delta = kraken.retrieve_all_ledger_data(start_date, api_key, api_sec)
-        ledger_df_delta = ledger_df_delta.loc[ledger_df_delta["date"] > start_timestamp]
+        # Keep only ledger IDs that are not stored yet (the delta restarts at the beginning of the last stored day)
+        ledger_df_delta = ledger_df_delta.loc[~ledger_df_delta.index.isin(ledger_df.index)]
         
-        # Ensure both DataFrames have the same structure before concatenation
+        # Prepend the new ledger entries to the stored ones
         if ledger_df.empty:
             ledger_df = ledger_df_delta
         elif ledger_df_delta.empty:
             pass
         else:
-            all_columns = list(set(ledger_df.columns) | set(ledger_df_delta.columns))
+            # concat aligns the columns itself, a column missing on one side is filled with NaN
+            ledger_df = pd.concat([ledger_df_delta, ledger_df], ignore_index=False, sort=False)
             
-            for col in all_columns:
-                if col not in ledger_df.columns:
-                    ledger_df[col] = None
-                if col not in ledger_df_delta.columns:
-                    ledger_df_delta[col] = None
-            
-            ledger_df = ledger_df[all_columns]
-            ledger_df_delta = ledger_df_delta[all_columns]
-            ledger_df = pd.concat([ledger_df_delta, ledger_df], ignore_index=False)
-            
-        # Write back to file
-        ledger_df.to_parquet(filename, engine="fastparquet", compression="GZIP")
+        # Write back to file, only when new ledger entries were downloaded
+        if not ledger_df_delta.empty:
+            ledger_df.to_parquet(filename, engine="pyarrow", compression="zstd")
         
         # Create columns with decimal value
-        ledger_df["decimalamount"] = ledger_df.apply(lambda row: kraken.decimal_from_value(row["amount"]), axis=1)
-        ledger_df["decimalbalance"] = ledger_df.apply(lambda row: kraken.decimal_from_value(row["balance"]), axis=1)
-        ledger_df["decimalfee"] = ledger_df.apply(lambda row: kraken.decimal_from_value(row["fee"]), axis=1)
+        ledger_df["decimalamount"] = [kraken.decimal_from_value(value) for value in ledger_df["amount"].to_numpy()]
+        ledger_df["decimalbalance"] = [kraken.decimal_from_value(value) for value in ledger_df["balance"].to_numpy()]
+        ledger_df["decimalfee"] = [kraken.decimal_from_value(value) for value in ledger_df["fee"].to_numpy()]
         ledger_df["justdate"] = ledger_df['date'].dt.normalize()
         
         ledger_df = kraken.normalize_assets_name(ledger_df, "asset", True)
@@ -247,7 +239,7 @@ def calculate_taxes_api():
         
         # Trades processing
         ledger_df_trade = ledger_df[ledger_df["assetnorm"]!="KFEE"]
-        ledger_df_trade = ledger_df_trade[(ledger_df_trade["type"]=="spend")|(ledger_df_trade["type"]=="receive")|(ledger_df_trade["type"]=="trade")].set_index("refid")
+        ledger_df_trade = ledger_df_trade[ledger_df_trade["type"].isin(["spend", "receive", "trade"])].set_index("refid")
         ledger_df_from = ledger_df_trade[ledger_df_trade["decimalamount"] < 0]
         ledger_df_to = ledger_df_trade[ledger_df_trade["decimalamount"] >= 0]
         ledger_df_trade = ledger_df_from.join(ledger_df_to, how="left", lsuffix="_from", rsuffix="_to")
@@ -274,7 +266,13 @@ def calculate_taxes_api():
 
         # Compute price
         ledger_df_trade_final = pd.concat([ledger_df_trade_sell, ledger_df_trade_buy], ignore_index=False)
-        ledger_df_trade_final["price"] = ledger_df_trade_final["total"]/ledger_df_trade_final["quantity"]*-1
+        # Free intermediate frames
+        del ledger_df_trade, ledger_df_from, ledger_df_to, ledger_df_trade_sell, ledger_df_trade_buy
+        # Missing legs give NaN, zero quantities a zero price
+        ledger_df_trade_final["price"] = [
+            float("nan") if pd.isna(total) or pd.isna(quantity) else -total / quantity if quantity else Decimal(0)
+            for total, quantity in zip(ledger_df_trade_final["total"].to_numpy(), ledger_df_trade_final["quantity"].to_numpy())
+        ]
         ledger_df_trade_final.sort_values(by=['datetime'], ascending=False, inplace=True)
 
         # Get OHLC data
@@ -316,7 +314,7 @@ def get_transactions():
     try:
         filename = os.path.join(PERSISTENT_DATA_DIR, "data", "kraken_ledger.parquet")
         if os.path.exists(filename):
-            ledger_df = pd.read_parquet(filename, engine="fastparquet")
+            ledger_df = pd.read_parquet(filename, engine="pyarrow")
             transactions = ledger_df.to_dict('records')
             return jsonify({'valid': True, 'transactions': transactions})
         else:
@@ -338,7 +336,7 @@ def get_balance():
         balance_df = kraken.get_balance_dataframe(api_key, api_sec)
         balance_df = balance_df.reset_index(names=['asset'])
         balance_df = kraken.normalize_assets_name(balance_df, "asset")
-        balance_df["balance"] = balance_df.apply(lambda row: kraken.decimal_from_value(row["balance"]), axis=1)
+        balance_df["balance"] = [kraken.decimal_from_value(value) for value in balance_df["balance"].to_numpy()]
         balance_df = balance_df[["balance","assetnorm"]]
         balance_df = balance_df.groupby(['assetnorm']).sum()
         
@@ -1,5 +1,9 @@
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from cryptography.fernet import Fernet
 import urllib.parse
 import hashlib
@@ -10,16 +14,34 @@ import numpy as np
 from datetime import datetime, timedelta
 from decimal import Decimal
 import os
-from config import KRAKEN_API_SETTINGS
+from config import KRAKEN_API_SETTINGS, ITALIAN_TAX_RATES
 import logging
 import json
+import orjson
 
 logger = logging.getLogger(__name__)
 
+# Root of the data kept between runs (API credentials, ledger, OHLC history and cached asset matrices)
+PERSISTENT_DATA_DIR = '/app/persistent_data'
+
+# Asset names that still differ from the Kraken ledger naming after stripping suffixes
+BASIC_ASSET_NAME_FIXES = {"EUR": "ZEUR", "XBT": "XXBT", "ETH": "XETH"}
+
+# Column layout of the OHLC candles returned by the API and of Kraken's downloadable historical CSV files
+OHLC_API_COLUMNS = ("timestamp", "open", "high", "low", "close", "vwap", "volume", "count")
+OHLC_CSV_COLUMNS = ("timestamp", "open", "high", "low", "close", "volume", "trades")
+
+# Capital gains tax rate as an exact Decimal (built from its string form, not from the binary float)
+CAPITAL_GAINS_TAX_RATE = Decimal(str(ITALIAN_TAX_RATES['short_term']))
+
 # Convert value to Decimal
 def decimal_from_value(value):
     return Decimal(value)
 
+# Convert a float (e.g. a stored price) to the Decimal of its shortest repr, i.e. the value Kraken sent
+def decimal_from_float(value):
+    return Decimal(repr(float(value)))
+
 def decimal_sum(value1, value2):
     return Decimal(value1) + Decimal(value2)
 
@@ -30,20 +52,37 @@ def generate_key(key_path="secret.key"):
     key = Fernet.generate_key()
     with open(key_path, "wb") as key_file:
         key_file.write(key)
+    # Drop any Fernet built from a previous key at this path
+    _fernet_cache.pop(key_path, None)
     return key
 
 def load_key(key_path="secret.key"):
     """
     Loads the key from the specified path.
     """
-    return open(key_path, "rb").read()
+    with open(key_path, "rb") as key_file:
+        return key_file.read()
+
+# key_path -> (st_mtime_ns, Fernet)
+_fernet_cache = {}
+
+def _get_fernet(key_path):
+    """
+    Returns the Fernet for the key at the specified path.
+    The key file is read again only when its modification time changes.
+    """
+    mtime_ns = os.stat(key_path).st_mtime_ns
+    cached = _fernet_cache.get(key_path)
+    if cached is None or cached[0] != mtime_ns:
+        cached = (mtime_ns, Fernet(load_key(key_path)))
+        _fernet_cache[key_path] = cached
+    return cached[1]
 
 def encrypt_message(message, key_path="secret.key"):
     """
     Encrypts a message using the key stored at the specified path.
     """
-    key = load_key(key_path)
-    f = Fernet(key)
+    f = _get_fernet(key_path)
     encrypted_message = f.encrypt(message.encode())
     return encrypted_message
 
@@ -51,8 +90,7 @@ def decrypt_message(encrypted_message, key_path="secret.key"):
     """
     Decrypts a message using the key stored at the specified path.
     """
-    key = load_key(key_path)
-    f = Fernet(key)
+    f = _get_fernet(key_path)
     decrypted_message = f.decrypt(encrypted_message.encode() if isinstance(encrypted_message, str) else encrypted_message)
     return decrypted_message.decode()
 
@@ -81,55 +119,172 @@ def write_key_to_file(key, file_name):
     with open(file_name, "wb") as key_file:
         key_file.write(key)
         
+# Keyed HMAC-SHA512 for the last API secret used, looked up by the SHA-256 digest of the secret
+_keyed_hmac_lock = threading.Lock()
+_keyed_hmac_cache = (None, None)
+
+def _keyed_hmac(secret):
+    global _keyed_hmac_cache
+    secret_digest = hashlib.sha256(secret.encode()).digest()
+    with _keyed_hmac_lock:
+        cached_digest, keyed_hmac = _keyed_hmac_cache
+        if cached_digest != secret_digest:
+            keyed_hmac = hmac.new(base64.b64decode(secret), digestmod=hashlib.sha512)
+            _keyed_hmac_cache = (secret_digest, keyed_hmac)
+        return keyed_hmac
+
 # Kraken Method
 def get_kraken_signature(urlpath, data, secret):
+    return _sign_postdata(urlpath, data['nonce'], urllib.parse.urlencode(data), secret)
 
-    postdata = urllib.parse.urlencode(data)
-    encoded = (str(data['nonce']) + postdata).encode()
+# Signature of an already url-encoded request body
+def _sign_postdata(urlpath, nonce, postdata, secret):
+    encoded = (str(nonce) + postdata).encode()
     message = urlpath.encode() + hashlib.sha256(encoded).digest()
 
-    mac = hmac.new(base64.b64decode(secret), message, hashlib.sha512)
+    # Copy the cached keyed state so the shared object is never updated
+    mac = _keyed_hmac(secret).copy()
+    mac.update(message)
     sigdigest = base64.b64encode(mac.digest())
     return sigdigest.decode()   
 
-# Attaches auth headers and returns results of a POST request
+# Shared HTTP session: keeps the TCP/TLS connection to Kraken alive between calls.
+# Only idempotent requests (GET) are retried, a signed POST carries a nonce that cannot be replayed.
+def _create_session():
+    session = requests.Session()
+    session.headers.update({'User-Agent': 'crypto-taxes/1.0'})
+    retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504])
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retries))
+    return session
+
+_session = _create_session()
+
+# Token bucket shared by all threads: allows short bursts, then refills at a fixed rate
+class _RateLimiter:
+    def __init__(self, rate_per_second, capacity):
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, cost=1):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate_per_second)
+                self.last_refill = now
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    return
+                wait_time = (cost - self.tokens) / self.rate_per_second
+            time.sleep(wait_time)
+
+    # The server reported a rate limit: drop the remaining burst so the next calls wait for a refill
+    def drain(self):
+        with self.lock:
+            self.tokens = 0
+            self.last_refill = time.monotonic()
+
+# Kraken public endpoints allow roughly one call per second
+_public_rate_limiter = _RateLimiter(rate_per_second=1, capacity=2)
+# Private endpoints share a call counter per API key: starter tier allows 15 points, decaying by 0.33 per second.
+# Ledger and trade history queries cost 2 points, every other private call 1
+_private_rate_limiter = _RateLimiter(rate_per_second=0.33, capacity=15)
+_PRIVATE_CALL_COSTS = {'/0/private/Ledgers': 2, '/0/private/QueryLedgers': 2, '/0/private/TradesHistory': 2}
+OHLC_FETCH_WORKERS = 4
+
+# Kraken errors meaning the call counter of the API key is exhausted, retried after an exponential backoff
+RATE_LIMIT_ERRORS = ("EAPI:Rate limit exceeded", "EGeneral:Too many requests")
+RATE_LIMIT_BACKOFF_SECONDS = 5
+
+def _is_rate_limit_error(errors):
+    return any(error.startswith(RATE_LIMIT_ERRORS) for error in errors)
+
+# Nonces must strictly increase per API key: microseconds since epoch, bumped by one if the clock
+# has not moved (or went backwards) since the previous call, shared safely between threads
+_nonce_lock = threading.Lock()
+_last_nonce = 0
+
+def _nonce():
+    global _last_nonce
+    with _nonce_lock:
+        _last_nonce = max(time.time_ns() // 1_000, _last_nonce + 1)
+        return str(_last_nonce)
+
+# Attaches nonce and auth headers and returns results of a POST request
 def kraken_request(uri_path, data, api_key, api_sec):
+    _private_rate_limiter.acquire(_PRIVATE_CALL_COSTS.get(uri_path, 1))
+    # Take the nonce after waiting for the rate limiter, so it is not issued long before the call is sent.
+    # Nonces are issued in increasing order, but concurrent threads may still reach Kraken out of order
+    data = {"nonce": _nonce(), **data}
     headers = {}
     headers['API-Key'] = api_key
-    # get_kraken_signature() as defined in the 'Authentication' section
-    headers['API-Sign'] = get_kraken_signature(uri_path, data, api_sec)             
-    res = requests.post((KRAKEN_API_SETTINGS['base_url'] + uri_path), headers=headers, data=data)
+    # Encode the body once: the same string is signed and sent
+    postdata = urllib.parse.urlencode(data)
+    # Signature as defined in the 'Authentication' section
+    headers['API-Sign'] = _sign_postdata(uri_path, data['nonce'], postdata, api_sec)
+    headers['Content-Type'] = 'application/x-www-form-urlencoded; charset=utf-8'
+    res = _session.post((KRAKEN_API_SETTINGS['base_url'] + uri_path), headers=headers, data=postdata, timeout=KRAKEN_API_SETTINGS['timeout'])
     return res
 
+# Parse a Kraken JSON response from the raw bytes
+def _json(res):
+    return orjson.loads(res.content)
+
 # Returns results of a GET request
 def kraken_public_request(uri_path):       
-    req = requests.get((KRAKEN_API_SETTINGS['base_url'] + uri_path))
+    _public_rate_limiter.acquire()
+    req = _session.get((KRAKEN_API_SETTINGS['base_url'] + uri_path), timeout=KRAKEN_API_SETTINGS['timeout'])
     return req
 
 # Auxiliary function, from datetime to timestamp
 def totimestamp(date):
-    unix = datetime.strptime(date, "%Y-%m-%d").timetuple()
-    unix_int = np.int32(time.mktime(unix))
-    return unix_int
+    # Naive dates are read as UTC, like the ledger 'date' column built from Kraken's epoch times
+    return np.int64(pd.Timestamp(date).timestamp())
 
 # Get stakable assets
 def get_stakeable_assets(api_key, api_sec):
-    resp_stak_assets = kraken_request('/0/private/Earn/Strategies', {
-            "nonce": str(int(1_000_000*time.time()))
-        }, get_kraken_api_key(), get_kraken_api_sec())
-    return resp_stak_assets.json() 
+    resp_stak_assets = kraken_request('/0/private/Earn/Strategies', {}, api_key, api_sec)
+    return _json(resp_stak_assets) 
+
+# Asset metadata changes rarely, keep a local copy for a day instead of calling the API on every run
+ASSET_MATRIX_CACHE_DIR = os.path.join(PERSISTENT_DATA_DIR, 'data')
+ASSET_MATRIX_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+def _read_cached_matrix(cache_name):
+    path = os.path.join(ASSET_MATRIX_CACHE_DIR, cache_name)
+    try:
+        if time.time() - os.path.getmtime(path) < ASSET_MATRIX_CACHE_TTL_SECONDS:
+            return pd.read_parquet(path, engine="pyarrow")
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Could not read cached {cache_name}: {e}")
+    return None
+
+def _write_cached_matrix(df, cache_name):
+    try:
+        os.makedirs(ASSET_MATRIX_CACHE_DIR, exist_ok=True)
+        df.to_parquet(os.path.join(ASSET_MATRIX_CACHE_DIR, cache_name), engine="pyarrow", compression="zstd")
+    except Exception as e:
+        logger.warning(f"Could not cache {cache_name}: {e}")
 
 # Create asset conversion matrix
 def create_asset_conversion_matrix(api_key, api_sec):
+    stakeable_asset_df = _read_cached_matrix("kraken_asset_conversion.parquet")
+    if stakeable_asset_df is not None:
+        return stakeable_asset_df
     stak_response_json = get_stakeable_assets(api_key, api_sec)
     stakeable_asset_df = pd.DataFrame(stak_response_json["result"]["items"])
     stakeable_asset_df = stakeable_asset_df[["asset","id"]].set_index("id")
+    _write_cached_matrix(stakeable_asset_df, "kraken_asset_conversion.parquet")
     return stakeable_asset_df
 
 # Get stakable assets
 def get_tradable_assets():
     resp_trad_assets = kraken_public_request('/0/public/AssetPairs')
-    return resp_trad_assets.json() 
+    return _json(resp_trad_assets) 
 
 # Get OHLC data single pair
 # since is the timestamp of the last data point we have (so it want be retrieved again)
@@ -141,11 +296,14 @@ def get_ohlc_data(pair, altname, interval=1440, since=None):
         resp_ohlc_data = kraken_public_request('/0/public/OHLC?pair=' + pair + '&interval=' + str(interval) + '&since=' + str(since))
     else:
         resp_ohlc_data = kraken_public_request('/0/public/OHLC?pair=' + pair + '&interval=' + str(interval))
-    resp_ohlc_data_json = resp_ohlc_data.json()
+    resp_ohlc_data_json = _json(resp_ohlc_data)
     resp_ohlc_data_df = pd.DataFrame([])
     if len(resp_ohlc_data_json["error"]) == 0:
-        resp_ohlc_data_df = pd.DataFrame(resp_ohlc_data_json["result"][altname], columns=["timestamp","open","high","low","close","vwap","volume","count"])
-        resp_ohlc_data_df = resp_ohlc_data_df.set_index("timestamp")
+        # Typed columns straight from the candle array: timestamp and count are integers, the rest are decimal strings
+        candles = np.asarray(resp_ohlc_data_json["result"][altname], dtype=object).reshape(-1, len(OHLC_API_COLUMNS))
+        ohlc_columns = {name: candles[:, i].astype(np.float64) for i, name in enumerate(OHLC_API_COLUMNS[1:-1], start=1)}
+        ohlc_columns["count"] = candles[:, -1].astype(np.int64)
+        resp_ohlc_data_df = pd.DataFrame(ohlc_columns, index=pd.Index(candles[:, 0].astype(np.int64), name="timestamp"))
         
         # Get the 'last' field from the API response
         last_valid_timestamp = resp_ohlc_data_json["result"]["last"]
@@ -158,69 +316,98 @@ def get_ohlc_data(pair, altname, interval=1440, since=None):
         print(resp_ohlc_data_json["error"])
     return resp_ohlc_data_df
 
+# Get OHLC data for several pairs in parallel
+# pair_requests is a list of (key, pair, altname, since), the result maps each key to its DataFrame
+# in request order; pairs that fail are reported and left out
+def get_ohlc_data_batch(pair_requests, interval=1440, max_workers=OHLC_FETCH_WORKERS):
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for key, pair, altname, since in pair_requests:
+            print(f"Fetching data for {key} ({pair})")
+            futures.append((key, executor.submit(get_ohlc_data, pair, altname, interval, since)))
+        
+        # Collect in submission order so the result does not depend on thread timing
+        for key, future in futures:
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                print(f"Error fetching data for {key}: {e}")
+    return results
+
 # Create tradable asset matrix
 def create_tradable_asset_matrix():
+    tradable_asset_df = _read_cached_matrix("kraken_tradable_assets.parquet")
+    if tradable_asset_df is not None:
+        return tradable_asset_df
     trad_response_json = get_tradable_assets()
     tradable_asset_df = pd.DataFrame(trad_response_json["result"]).transpose()
     tradable_asset_df = tradable_asset_df[["base","quote","altname","wsname"]]
     tradable_asset_df = tradable_asset_df.reset_index()
     tradable_asset_df = tradable_asset_df.set_index(["base","quote"])
+    _write_cached_matrix(tradable_asset_df, "kraken_tradable_assets.parquet")
     return tradable_asset_df
 
 # Get the transaction performed in Kraken in a specific time interval
 def get_ledger(start_date, ofs, api_key, api_sec, without_count = "false"):
     start_timestamp = totimestamp(start_date)
     resp_ledger = kraken_request('/0/private/Ledgers', {
-            "nonce": str(int(1_000_000*time.time())),
             "start": start_timestamp,
             "ofs": ofs,
             "without_count": without_count
         }, api_key, api_sec)
-    return resp_ledger.json() 
+    return _json(resp_ledger) 
 
 # Get all transaction performed in Kraken
 def retrieve_all_ledger_data(start_date, api_key, api_sec):
     tx_batch_size = 50
-    sleeping_time = 4 # After every call we should sleep 4s to refill entirely the call limit counter
     has_new_transactions = True
-    ledger_df = pd.DataFrame([])
+    ledger_frames = []
+    retrieved_count = 0
     consecutive_error_counter = 0
     iter_num = 0
     total_count = 0
     without_count = "false"     
     while has_new_transactions:
         response_json = get_ledger(start_date, iter_num*tx_batch_size, api_key, api_sec, without_count)
-        # Get the total counter
-        if without_count == "false":
-            total_count = response_json["result"]["count"]
-            without_count = "true"
         # Check if there were some errors
         if len(response_json["error"]) == 0:
             consecutive_error_counter = 0
+            # Get the total counter
+            if without_count == "false":
+                total_count = response_json["result"]["count"]
+                without_count = "true"
             resp_ledger_json = response_json["result"]["ledger"]
-            partial_ledger_df =  pd.DataFrame(resp_ledger_json).transpose()
-            ledger_df = pd.concat([ledger_df, partial_ledger_df])
-            has_new_transactions = (ledger_df.shape[0]) < total_count
+            # One row per ledger ID
+            partial_ledger_df = pd.DataFrame.from_dict(resp_ledger_json, orient='index')
+            ledger_frames.append(partial_ledger_df)
+            retrieved_count = retrieved_count + partial_ledger_df.shape[0]
+            has_new_transactions = retrieved_count < total_count
+            # The private rate limiter in kraken_request paces the next page
             print("Call C-" + str(iter_num) + " performed")
-            if has_new_transactions:
-                print("\tNow Sleeping...")
-                time.sleep(sleeping_time) 
             iter_num = iter_num + 1
         else:
             print("ERROR " + str(consecutive_error_counter))
             print(response_json["error"])
-            has_new_transactions = consecutive_error_counter < 2
             consecutive_error_counter = consecutive_error_counter + 1
-    # Add date column
-    ledger_df["date"] = pd.to_datetime(ledger_df["time"], unit='s')
+            if consecutive_error_counter > 2:
+                # Never return a partial ledger: it would be stored as complete and the missing entries never downloaded
+                raise Exception(f"Could not retrieve the ledger after {consecutive_error_counter} attempts: {response_json['error']}")
+            if _is_rate_limit_error(response_json["error"]):
+                # Kraken's counter for this key is full (e.g. right after a previous run): empty the local bucket and wait
+                _private_rate_limiter.drain()
+                time.sleep(RATE_LIMIT_BACKOFF_SECONDS * 2 ** (consecutive_error_counter - 1))
+    # Concatenate all the pages
+    ledger_df = pd.concat(ledger_frames) if ledger_frames else pd.DataFrame([])
+    # Add date column, converting only the rows downloaded in this call in a single vectorized pass
+    if not ledger_df.empty:
+        ledger_df["date"] = pd.to_datetime(ledger_df["time"], unit='s')
     return ledger_df  
 
 # Get the current balance
 def get_balance(api_key, api_sec, without_count = "false"):
-    resp_ledger = kraken_request('/0/private/Balance', {
-            "nonce": str(int(1_000_000*time.time()))
-        }, api_key, api_sec)
-    return resp_ledger.json() 
+    resp_ledger = kraken_request('/0/private/Balance', {}, api_key, api_sec)
+    return _json(resp_ledger) 
 
 # Get the current balance
 def get_balance_dataframe(api_key, api_sec):
@@ -246,18 +433,17 @@ def normalize_assets_name(df, asset_column_name, api_key=None, api_sec=None, log
     Returns:
         DataFrame with normalized asset names in 'assetnorm' column
     """
-    # Get all assets keys in the portfolio
-    assets_in_portofolio = df[asset_column_name].unique()
+    # Get all assets keys in the portfolio (only needed for logging)
     if log_message:
         print("All assets:")
-        print(assets_in_portofolio)
+        print(df[asset_column_name].unique())
 
     # Load API credentials if not provided
     if api_key is None or api_sec is None:
         try:
             encrypted_key, encrypted_secret = load_encrypted_credentials()
             if encrypted_key and encrypted_secret:
-                secret_key_path = '/app/persistent_data/config/secret.key'
+                secret_key_path = os.path.join(PERSISTENT_DATA_DIR, 'config', 'secret.key')
                 api_key = decrypt_message(encrypted_key, secret_key_path)
                 api_sec = decrypt_message(encrypted_secret, secret_key_path)
                 if log_message:
@@ -278,10 +464,9 @@ def normalize_assets_name(df, asset_column_name, api_key=None, api_sec=None, log
     try:
         conv_matrix_df = create_asset_conversion_matrix(api_key, api_sec)
         
-        # Normalize the asset keys
-        df["assetnorm"] = df[asset_column_name]
-        for index, row in conv_matrix_df.iterrows():
-            df.loc[(df[asset_column_name] == index), "assetnorm"] = row[asset_column_name]
+        # Normalize the asset keys with one hashed lookup, keys without a conversion keep their name
+        conv_dict = conv_matrix_df[asset_column_name].to_dict()
+        assetnorm = df[asset_column_name].map(conv_dict).fillna(df[asset_column_name])
     except Exception as e:
         if log_message:
             print(f"Warning: Could not create conversion matrix: {e}")
@@ -289,22 +474,20 @@ def normalize_assets_name(df, asset_column_name, api_key=None, api_sec=None, log
         # Fall back to basic normalization without API data
         return _basic_normalize_assets_name(df, asset_column_name, log_message)
 
-    # Apply basic normalization rules
-    df = _apply_basic_normalization_rules(df)
+    # Apply basic normalization rules and add the column in a single assignment
+    df = df.assign(assetnorm=_apply_basic_normalization_rules(assetnorm))
 
     # Normalized asset list
-    assets_in_portofolio = df["assetnorm"].unique()
     if log_message:
         print("Normalized assets:")
-        print(assets_in_portofolio)
+        print(df["assetnorm"].unique())
     return df
 
 def _basic_normalize_assets_name(df, asset_column_name, log_message=False):
     """
     Basic asset name normalization without API data.
     """
-    df["assetnorm"] = df[asset_column_name]
-    df = _apply_basic_normalization_rules(df)
+    df = df.assign(assetnorm=_apply_basic_normalization_rules(df[asset_column_name]))
     
     if log_message:
         print("Basic normalization applied (no API data)")
@@ -313,36 +496,46 @@ def _basic_normalize_assets_name(df, asset_column_name, log_message=False):
     
     return df
 
-def _apply_basic_normalization_rules(df):
+def _apply_basic_normalization_rules(asset_names):
     """
-    Apply basic normalization rules to asset names.
+    Apply basic normalization rules to a Series of asset names.
     """
     # Fix remaining asset name manually 
-    df["assetnorm"] = df["assetnorm"].str.split('.').str[0]
-    df["assetnorm"] = df["assetnorm"].str.split('21').str[0]
-    df.loc[(df["assetnorm"]=="EUR"),["assetnorm"]] = "ZEUR"
-    df.loc[(df["assetnorm"]=="XBT"),["assetnorm"]] = "XXBT"
-    df.loc[(df["assetnorm"]=="ETH"),["assetnorm"]] = "XETH"
-    
-    return df
+    # Drop everything from the first '.' or '21' (e.g. staking and opt-in suffixes) in one regex pass
+    return asset_names.str.replace(r"(\.|21).*$", "", regex=True).replace(BASIC_ASSET_NAME_FIXES)
 
 # INPUT: Ledger with trades (without sells), and simulation_df
 # OUTPUT: Ledger with remaining trades, dict with gains, initial purchase values, and final sale values
 def get_ledger_after_tax_computation(input_ledger_df, input_quantity_to_sell_df):
     
-    ledger_out_df = input_ledger_df.copy()
-    ledger_out_df = ledger_out_df.reset_index()
-    ledger_out_df["isvalid"] = True
+    # reset_index already returns a new frame, the input is never modified
+    ledger_out_df = input_ledger_df.reset_index()
     output_gains = {}
     output_initial_values = {}
     output_final_values = {}
     
-    for asset, input_row in input_quantity_to_sell_df.iterrows():
-        remaining_quantity_to_be_sold = input_row["quantity"]
+    # Lots as plain arrays, updated in place
+    lot_quantity = ledger_out_df["quantity"].to_numpy(dtype=object, copy=True)
+    lot_total = ledger_out_df["total"].to_numpy(dtype=object, copy=True)
+    lot_price = ledger_out_df["price"].to_numpy(dtype=object)
+    lot_datetime = ledger_out_df["datetime"].to_numpy()
+    lot_isvalid = np.ones(len(ledger_out_df), dtype=bool)
+    
+    # Lots of each asset sorted by datetime, ties in reverse ledger order, so that walking backwards
+    # from the cutoff visits the most recent lots first (LIFO) with ties in ledger order
+    lots_by_asset = {}
+    for lot_asset, positions in ledger_out_df.groupby("asset", sort=False).indices.items():
+        positions = positions[::-1]
+        positions = positions[np.argsort(lot_datetime[positions], kind="stable")]
+        lots_by_asset[lot_asset] = (positions, lot_datetime[positions])
+    
+    # Iterate the sells
+    for asset, sell_quantity, sell_price, sell_datetime in input_quantity_to_sell_df[["quantity","price","datetime"]].itertuples(index=True, name=None):
+        remaining_quantity_to_be_sold = sell_quantity
         gain = Decimal(0)
         initial_purchase_value = Decimal(0)
         final_sale_value = Decimal(0)
-        tax_year = input_row["datetime"].year
+        tax_year = sell_datetime.year
         
         # Initialize dictionaries
         if output_gains.get((tax_year,asset)) is None:
@@ -351,51 +544,50 @@ def get_ledger_after_tax_computation(input_ledger_df, input_quantity_to_sell_df)
             output_final_values[(tax_year,asset)] = Decimal(0)
         
         # Compute gains with LIFO strategy
-        if remaining_quantity_to_be_sold > 0:
-            # Filter ledger to only include transactions before the sell datetime
-            valid_ledger_df = ledger_out_df[
-                (ledger_out_df["asset"] == asset) & 
-                (ledger_out_df["datetime"] < input_row["datetime"]) &
-                (ledger_out_df["isvalid"])
-            ].copy()
+        if remaining_quantity_to_be_sold > 0 and asset in lots_by_asset:
+            positions, sorted_datetimes = lots_by_asset[asset]
+            # Only transactions before the sell datetime can be used
+            sell_datetime64 = np.datetime64(sell_datetime)
+            cutoff = 0 if np.isnat(sell_datetime64) else np.searchsorted(sorted_datetimes, sell_datetime64, side="left")
             
-            # Sort by datetime descending to implement LIFO (most recent first)
-            valid_ledger_df = valid_ledger_df.sort_values(by=['datetime'], ascending=False)
-            
-            for index, ledger_row in valid_ledger_df.iterrows():
-                if remaining_quantity_to_be_sold > 0:
-                    # Use the entire quantity of the row
-                    if remaining_quantity_to_be_sold > ledger_row["quantity"]:
-                        output_total = ledger_row["quantity"] * input_row["price"]
-                        original_cost = ledger_row["total"]
-                        gain = gain + output_total - original_cost
-                        initial_purchase_value = initial_purchase_value + original_cost
-                        final_sale_value = final_sale_value + output_total
-                        remaining_quantity_to_be_sold = remaining_quantity_to_be_sold - ledger_row["quantity"]
-                        ledger_out_df.at[index,"isvalid"] = False
-                     # Update the quantity in the row
-                    else:
-                        remaining_quantity = ledger_row["quantity"] - remaining_quantity_to_be_sold
-                        output_total = remaining_quantity_to_be_sold * input_row["price"]
-                        original_cost = remaining_quantity_to_be_sold * ledger_row["price"]
-                        gain = gain + output_total - original_cost
-                        initial_purchase_value = initial_purchase_value + original_cost
-                        final_sale_value = final_sale_value + output_total
-                        # Update ledger quantity
-                        ledger_out_df.at[index,"quantity"] = remaining_quantity
-                        # Update ledger total
-                        ledger_out_df.at[index,"total"] = ledger_row["total"] - original_cost
-                        remaining_quantity_to_be_sold = 0
-            # Remove rows already used
-            ledger_out_df = ledger_out_df[ledger_out_df["isvalid"]].copy()
+            for index in positions[cutoff-1::-1] if cutoff > 0 else ():
+                if remaining_quantity_to_be_sold <= 0:
+                    break
+                if not lot_isvalid[index]:
+                    continue
+                # Use the entire quantity of the row
+                if remaining_quantity_to_be_sold > lot_quantity[index]:
+                    output_total = lot_quantity[index] * sell_price
+                    original_cost = lot_total[index]
+                    gain = gain + output_total - original_cost
+                    initial_purchase_value = initial_purchase_value + original_cost
+                    final_sale_value = final_sale_value + output_total
+                    remaining_quantity_to_be_sold = remaining_quantity_to_be_sold - lot_quantity[index]
+                    lot_isvalid[index] = False
+                 # Update the quantity in the row
+                else:
+                    remaining_quantity = lot_quantity[index] - remaining_quantity_to_be_sold
+                    output_total = remaining_quantity_to_be_sold * sell_price
+                    original_cost = remaining_quantity_to_be_sold * lot_price[index]
+                    gain = gain + output_total - original_cost
+                    initial_purchase_value = initial_purchase_value + original_cost
+                    final_sale_value = final_sale_value + output_total
+                    # Update ledger quantity
+                    lot_quantity[index] = remaining_quantity
+                    # Update ledger total
+                    lot_total[index] = lot_total[index] - original_cost
+                    remaining_quantity_to_be_sold = 0
         
         # Save results
         output_gains[(tax_year,asset)] = output_gains[(tax_year,asset)] + gain
         output_initial_values[(tax_year,asset)] = output_initial_values[(tax_year,asset)] + initial_purchase_value
         output_final_values[(tax_year,asset)] = output_final_values[(tax_year,asset)] + final_sale_value
     
-    # Output results
-    ledger_out_df = ledger_out_df.copy()
+    # Write the updated lots back once and remove the rows already used
+    ledger_out_df["quantity"] = lot_quantity
+    ledger_out_df["total"] = lot_total
+    ledger_out_df["isvalid"] = lot_isvalid
+    ledger_out_df = ledger_out_df[lot_isvalid]
     
     # Create DataFrame with all the information
     results_data = []
@@ -430,18 +622,16 @@ def get_ledger_after_tax_computation(input_ledger_df, input_quantity_to_sell_df)
 # OUTPUT: Ledger with remaining trades, dict with gains
 def compute_taxes(input_ledger_df):
     
-    input_ledger_sim_df = input_ledger_df.copy()
-    
-    # Get all the sell transactions
-    input_quantity_already_sold_df = input_ledger_sim_df[input_ledger_sim_df["quantity"]<0].copy()
-    input_quantity_already_sold_df["quantity"] = input_quantity_already_sold_df["quantity"] *-1
-    input_quantity_already_sold_df = input_quantity_already_sold_df.set_index("asset")
-    input_quantity_already_sold_df.sort_values(by=['datetime'], ascending=True, inplace=True)
-    input_quantity_already_sold_df = input_quantity_already_sold_df[["price","total","quantity","datetime"]]
+    quantity = input_ledger_df["quantity"]
+
+    # Get all the sell transactions (flip the sign while selecting, keep only the needed columns before sorting)
+    sells_df = input_ledger_df[quantity < 0]
+    input_quantity_already_sold_df = sells_df.assign(quantity=sells_df["quantity"] * -1).set_index("asset")[["price","total","quantity","datetime"]]
+    input_quantity_already_sold_df = input_quantity_already_sold_df.sort_values(by=['datetime'], ascending=True)
 
     # Remove all the sell transactions from the ledger
-    input_ledger_without_sells_df = input_ledger_sim_df[input_ledger_sim_df["quantity"]>=0].copy()
-    input_ledger_without_sells_df["total"] = input_ledger_without_sells_df["total"]*-1
+    buys_df = input_ledger_df[quantity >= 0]
+    input_ledger_without_sells_df = buys_df.assign(total=buys_df["total"] * -1)
     
     # Get ledger and gains
     output_ledger_df, gains_by_year_df = get_ledger_after_tax_computation(input_ledger_without_sells_df, input_quantity_already_sold_df)
@@ -456,29 +646,37 @@ def calculate_year_end_balances(ledger_df, OHLC_df, reference_asset="ZEUR", exce
     # Get unique years from the ledger data
     years = ledger_df['date'].dt.year.unique()
     years = sorted(years)
+    # Year-end sentinels built once and reused for the ledger filter and the price lookup
+    year_ends = {year: np.datetime64(f"{year}-12-31") for year in years}
+    
+    # Sorted dates and prices for each asset
+    ohlc_by_asset = {}
+    if not OHLC_df.empty:
+        for asset, asset_data in OHLC_df.groupby(level='crypto', sort=False):
+            asset_data = asset_data.sort_index(level='date', kind='stable')
+            ohlc_by_asset[asset] = (asset_data.index.get_level_values('date').to_numpy(), asset_data['price'].to_numpy())
+    
+    # Running balance of each asset at every year-end, computed in one pass:
+    # each entry is assigned to the first year-end on or after its date, then the per-year sums are accumulated
+    year_index = np.searchsorted(np.array(list(year_ends.values())), ledger_df['date'].to_numpy(), side='left')
+    balances_by_year = (
+        ledger_df.groupby([year_index, 'asset'])['quantity'].sum()
+        .unstack('asset', fill_value=Decimal(0))
+        .reindex(range(len(years)), fill_value=Decimal(0))
+        .cumsum()
+    )
     
     print("\n" + "="*80)
     print("YEAR-END BALANCE SUMMARY")
     print("="*80)
     
-    for year in years:
+    for year_position, year in enumerate(years):
         print(f"\n--- {year} YEAR-END BALANCE (December 31, {year}) ---")
         
-        # Filter ledger data up to the end of the year
         year_end_date = f"{year}-12-31"
-        ledger_until_year_end = ledger_df[ledger_df['date'] <= year_end_date].copy()
-        
-        # Calculate running balance for each asset
-        balance_by_asset = {}
-        
-        for _, row in ledger_until_year_end.iterrows():
-            asset = row['asset']
-            amount = row['quantity']
-            
-            if asset not in balance_by_asset:
-                balance_by_asset[asset] = Decimal(0)
-            
-            balance_by_asset[asset] += amount
+        year_end_datetime = year_ends[year]
+        # Balance of each asset up to the end of the year
+        balance_by_asset = balances_by_year.iloc[year_position]
         
         # Create summary table for this year
         year_summary = []
@@ -493,30 +691,19 @@ def calculate_year_end_balances(ledger_df, OHLC_df, reference_asset="ZEUR", exce
                 else:
                     # Try to get price for the year-end date
                     try:
-                        year_end_datetime = pd.to_datetime(year_end_date)
-                        # Look for price data for this asset and date
-                        if not OHLC_df.empty and (year_end_datetime, asset) in OHLC_df.index:
-                            price = decimal_from_value(OHLC_df.loc[(year_end_datetime, asset), 'price'])
-                        else:
-                            # Try to get the latest available price for this asset
-                            asset_data = OHLC_df.xs(asset, level='crypto', drop_level=False) if not OHLC_df.empty else pd.DataFrame()
-                            if not asset_data.empty:
-                                # Get the latest price before or on the year-end date
-                                available_dates = asset_data.index.get_level_values('date')
-                                valid_dates = available_dates[available_dates <= year_end_datetime]
-                                if len(valid_dates) > 0:
-                                    latest_date = valid_dates.max()
-                                    # If you do not have the price for the last day of the year, use the latest available price
-                                    price_value = asset_data.loc[latest_date, 'price']
-                                    if isinstance(price_value, pd.Series):
-                                        price_value = price_value.iloc[0]  # Get the latest date available 
-                                    price = decimal_from_value(price_value)
-                                else:
-                                    price = Decimal(0)
-                                    print(f"  Warning: No price data found for {asset} before {year_end_date}")
+                        if asset in ohlc_by_asset:
+                            # Get the latest price before or on the year-end date
+                            # If you do not have the price for the last day of the year, use the latest available price
+                            dates, prices = ohlc_by_asset[asset]
+                            idx = np.searchsorted(dates, year_end_datetime, side='right') - 1
+                            if idx >= 0:
+                                price = decimal_from_float(prices[idx])
                             else:
                                 price = Decimal(0)
-                                print(f"  Warning: No price data found for {asset}")
+                                print(f"  Warning: No price data found for {asset} before {year_end_date}")
+                        else:
+                            price = Decimal(0)
+                            print(f"  Warning: No price data found for {asset}")
                         
                         eur_value = balance * price
                     except Exception as e:
@@ -540,10 +727,13 @@ def calculate_year_end_balances(ledger_df, OHLC_df, reference_asset="ZEUR", exce
         if year_summary:
             print(f"{'Asset':<15} {'Balance':<15} {'Price (EUR)':<12} {'Value (EUR)':<12}")
             print("-" * 60)
-            
-            for item in year_summary:
-                print(f"{item['Asset']:<15} {item['Balance']:<15.8f} {item['Price (EUR)']:<12.4f} {item['Value (EUR)']:<12.2f}")
-            
+
+            # Print the table
+            print("\n".join(
+                f"{item['Asset']:<15} {item['Balance']:<15.8f} {item['Price (EUR)']:<12.4f} {item['Value (EUR)']:<12.2f}"
+                for item in year_summary
+            ))
+
             print("-" * 60)
             print(f"{'TOTAL':<15} {'':<15} {'':<12} {float(year_total_value):<12.2f}")
         else:
@@ -551,6 +741,19 @@ def calculate_year_end_balances(ledger_df, OHLC_df, reference_asset="ZEUR", exce
     
     return year_summary
 
+# Load one of Kraken's downloadable daily OHLC CSV files as (date, crypto, price, timestamp) records
+def _load_historical_csv(asset, csv_filename):
+    # Read CSV file without headers and with specific column names
+    csv_df = pd.read_csv(csv_filename, header=None, names=list(OHLC_CSV_COLUMNS))
+    
+    # Build the records column by column, prices stay float64 until the tax computation
+    return pd.DataFrame({
+        'date': pd.to_datetime(csv_df["timestamp"], unit='s').dt.normalize().to_numpy(),
+        'crypto': asset,
+        'price': csv_df["close"].to_numpy(dtype=np.float64),
+        'timestamp': csv_df["timestamp"].to_numpy()
+    })
+
 def get_ohlc_data_with_persistence(assets_in_portfolio, reference_asset="ZEUR", exception_assets=["KFEE","NFT"], start_date="2021-01-01"):
     """
     Get OHLC data for multiple assets with persistence to parquet file.
@@ -561,27 +764,29 @@ def get_ohlc_data_with_persistence(assets_in_portfolio, reference_asset="ZEUR",
     """
     
     # Use persistent data directory
-    persistent_data_dir = '/app/persistent_data'
-    filename = os.path.join(persistent_data_dir, "data", "kraken_ohlc.parquet")
+    filename = os.path.join(PERSISTENT_DATA_DIR, "data", "kraken_ohlc.parquet")
     tradable_asset_pair = create_tradable_asset_matrix()
     
     # Ensure data directory exists
     os.makedirs(os.path.dirname(filename), exist_ok=True)
     
+    # Resolve asset -> (altname, index) of its pair against the reference asset with a plain dict lookup
+    reference_pairs = tradable_asset_pair.xs(reference_asset, level='quote')
+    pair_map = dict(zip(reference_pairs.index, zip(reference_pairs["altname"], reference_pairs["index"])))
+    
     # Add MATIC/POL mapping
-    new_row_data = {
-        'altname': 'POLEUR',
-        'index': 'POLEUR',
-        'wsname': 'POL/EUR'
-    }
-    new_index = pd.MultiIndex.from_tuples([('MATIC', 'ZEUR')], names=['base', 'quote'])
-    new_row_df = pd.DataFrame([new_row_data], index=new_index)
-    tradable_asset_pair = pd.concat([tradable_asset_pair, new_row_df])
+    if reference_asset == 'ZEUR':
+        pair_map['MATIC'] = ('POLEUR', 'POLEUR')
     
     # Load existing data
     existing_ohlc_df = pd.DataFrame()
+    loaded_from_parquet = False
     try:
-        existing_ohlc_df = pd.read_parquet(filename, engine="fastparquet")
+        existing_ohlc_df = pd.read_parquet(filename, engine="pyarrow")
+        loaded_from_parquet = True
+        # Files written before prices were stored as float64 hold Decimal objects
+        if existing_ohlc_df["price"].dtype != np.float64:
+            existing_ohlc_df["price"] = existing_ohlc_df["price"].astype(np.float64)
         print(f"\tLoaded existing OHLC data: {existing_ohlc_df.shape[0]} records")
     except FileNotFoundError:
         print("No existing OHLC data found, checking for historical CSV files...")
@@ -591,38 +796,28 @@ def get_ohlc_data_with_persistence(assets_in_portfolio, reference_asset="ZEUR",
         if os.path.exists(csv_folder):
             print(f"Found historical data folder: {csv_folder}")
             
-            # Collect historical data from CSV files
-            historical_data = []
+            # Collect historical data from CSV files, one frame per asset
+            historical_frames = []
+            # Files available in the historical folder
+            available_csv_files = set(os.listdir(csv_folder))
             
+            csv_jobs = []
             for asset in assets_in_portfolio:
                 if (asset not in exception_assets) and (asset != reference_asset):
                     try:
-                        pair_name = tradable_asset_pair.loc[asset, reference_asset].loc["altname"]
+                        pair = pair_map.get(asset)
+                        if pair is None:
+                            print(f"No {reference_asset} pair found for {asset}, skipping historical data")
+                            continue
+                        pair_name = pair[0]
                         
                         # Look for CSV file with 1440 minutes frequency
-                        csv_filename = f"{csv_folder}/{pair_name}_1440.csv"
+                        csv_name = f"{pair_name}_1440.csv"
+                        csv_filename = f"{csv_folder}/{csv_name}"
                         
-                        if os.path.exists(csv_filename):
+                        if csv_name in available_csv_files:
                             print(f"Loading historical data for {asset} from {csv_filename}")
-                            
-                            # Read CSV file without headers and with specific column names
-                            csv_df = pd.read_csv(csv_filename, header=None, 
-                                                names=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'trades'])
-                            
-                            # Convert timestamp to datetime and normalize to date
-                            csv_df["date"] = pd.to_datetime(csv_df["timestamp"], unit='s').dt.normalize()
-                            
-                            # Convert close price to Decimal and create records
-                            for _, row in csv_df.iterrows():
-                                price = decimal_from_value(row["close"])
-                                historical_data.append({
-                                    'date': row["date"],
-                                    'crypto': asset,
-                                    'price': price,
-                                    'timestamp': row["timestamp"]
-                                })
-                            
-                            print(f"Loaded {len(csv_df)} historical records for {asset}")
+                            csv_jobs.append((asset, csv_filename))
                         else:
                             print(f"No historical CSV file found for {asset} ({csv_filename})")
                             
@@ -630,85 +825,104 @@ def get_ohlc_data_with_persistence(assets_in_portfolio, reference_asset="ZEUR",
                         print(f"Error loading historical data for {asset}: {e}")
                         continue
             
+            # Parse the files in parallel, collecting them in request order
+            with ThreadPoolExecutor(max_workers=OHLC_FETCH_WORKERS) as executor:
+                futures = [(asset, executor.submit(_load_historical_csv, asset, csv_filename)) for asset, csv_filename in csv_jobs]
+                for asset, future in futures:
+                    try:
+                        asset_df = future.result()
+                        if not asset_df.empty:
+                            historical_frames.append(asset_df)
+                        print(f"Loaded {len(asset_df)} historical records for {asset}")
+                    except Exception as e:
+                        print(f"Error loading historical data for {asset}: {e}")
+            
             # Create DataFrame from historical data
-            if historical_data:
-                existing_ohlc_df = pd.DataFrame(historical_data)
+            if historical_frames:
+                existing_ohlc_df = pd.concat(historical_frames, ignore_index=True)
                 existing_ohlc_df = existing_ohlc_df.set_index(['date', 'crypto'])
-                print(f"Created initial dataset with {len(historical_data)} historical records")
+                print(f"Created initial dataset with {existing_ohlc_df.shape[0]} historical records")
             else:
                 print("No historical data found, starting fresh")
         else:
             print(f"Historical data folder {csv_folder} not found, starting fresh")
     
-    # Collect new OHLC data
-    new_ohlc_data = []
+    # Plan the fetches first (no network), one job per asset that needs new data
+    fetch_jobs = []
+    
+    # Same reference time for every asset, data newer than two daily candles is not refreshed
+    current_time = datetime.now().timestamp()
+    min_interval_seconds = 1440 * 60 * 2
+    
+    # Latest stored timestamp per asset
+    latest_by_asset = {}
+    if not existing_ohlc_df.empty and 'timestamp' in existing_ohlc_df.columns:
+        latest_by_asset = existing_ohlc_df.groupby(level='crypto')['timestamp'].max().to_dict()
     
     for asset in assets_in_portfolio:
         if (asset not in exception_assets) and (asset != reference_asset):
+            pair = pair_map.get(asset)
+            if pair is None:
+                print(f"No {reference_asset} pair found for {asset}, skipping")
+                continue
             try:
-                pair_name = tradable_asset_pair.loc[asset, reference_asset].loc["altname"]
-                pair_altname = tradable_asset_pair.loc[asset, reference_asset].loc["index"]
+                pair_name, pair_altname = pair
                 
                 # Get the latest timestamp for this asset from existing data
-                latest_timestamp = None
-                if not existing_ohlc_df.empty:
-                    asset_data = existing_ohlc_df.xs(asset, level='crypto', drop_level=False) if asset in existing_ohlc_df.index.get_level_values('crypto') else pd.DataFrame()
-                    if not asset_data.empty and 'timestamp' in asset_data.columns:
-                        latest_timestamp = asset_data['timestamp'].max()
-                        print(f"Latest timestamp for {asset}: {latest_timestamp} ({datetime.fromtimestamp(latest_timestamp)})")
+                latest_timestamp = latest_by_asset.get(asset)
+                if latest_timestamp is not None:
+                    print(f"Latest timestamp for {asset}: {latest_timestamp} ({datetime.fromtimestamp(latest_timestamp)})")
                 
                 # Check if we need to fetch new data (avoid calls for very recent timestamps)
-                current_time = datetime.now().timestamp()
-                min_interval_seconds = 1440 * 60 * 2
-                
                 if latest_timestamp is not None and (current_time - latest_timestamp) < min_interval_seconds:
                     print(f"Skipping {asset} - latest data is too recent (less than 1440 minutes ago)")
                     continue
                 
-                print(f"Fetching data for {asset} ({pair_name})")
-                
-                # Get OHLC data with daily interval (1440 minutes) and latest timestamp
-                ohlc_df = get_ohlc_data(pair_name, pair_altname, interval=1440, since=latest_timestamp)
-
-                print(f"\tfetched {ohlc_df.shape[0]} rows")
-                
-                if not ohlc_df.empty:
-                    # Reset index to get timestamp as column
-                    ohlc_df = ohlc_df.reset_index()
-                    ohlc_df["date"] = pd.to_datetime(ohlc_df["timestamp"], unit='s').dt.normalize()
-                    
-                    # Convert close price to Decimal and create records
-                    for _, row in ohlc_df.iterrows():
-                        price = decimal_from_value(row["close"])
-                        new_ohlc_data.append({
-                            'date': row["date"],
-                            'crypto': asset,
-                            'price': price,
-                            'timestamp': row["timestamp"]
-                        })
-                
-                # Sleep to avoid rate limiting
-                time.sleep(1)
+                fetch_jobs.append((asset, pair_name, pair_altname, latest_timestamp))
                 
             except Exception as e:
                 print(f"Error fetching data for {asset}: {e}")
                 continue
     
+    # Fetch the assets in parallel, the public rate limiter paces the actual API calls
+    new_ohlc_frames = []
+    # Get OHLC data with daily interval (1440 minutes) from the latest stored timestamp
+    fetched_ohlc = get_ohlc_data_batch(fetch_jobs, interval=1440)
+    
+    for asset, ohlc_df in fetched_ohlc.items():
+        try:
+            print(f"\tfetched {ohlc_df.shape[0]} rows for {asset}")
+            
+            if not ohlc_df.empty:
+                # Reset index to get timestamp as column
+                ohlc_df = ohlc_df.reset_index()
+                ohlc_df["date"] = pd.to_datetime(ohlc_df["timestamp"], unit='s').dt.normalize()
+                
+                # Build the records column by column, prices stay float64 until the tax computation
+                new_ohlc_frames.append(pd.DataFrame({
+                    'date': ohlc_df["date"].to_numpy(),
+                    'crypto': asset,
+                    'price': ohlc_df["close"].to_numpy(dtype=np.float64),
+                    'timestamp': ohlc_df["timestamp"].to_numpy()
+                }))
+            
+        except Exception as e:
+            print(f"Error processing OHLC data for {asset}: {e}")
+            continue
+    
     # Create new DataFrame
-    if new_ohlc_data:
-        new_ohlc_df = pd.DataFrame(new_ohlc_data)
+    if new_ohlc_frames:
+        new_ohlc_df = pd.concat(new_ohlc_frames, ignore_index=True)
         new_ohlc_df = new_ohlc_df.set_index(['date', 'crypto'])
-        print(f"Fetched {len(new_ohlc_data)} new OHLC records")
+        print(f"Fetched {new_ohlc_df.shape[0]} new OHLC records")
     else:
         new_ohlc_df = pd.DataFrame()
         print("No new OHLC data fetched")
     
     # Merge with existing data
     if not existing_ohlc_df.empty and not new_ohlc_df.empty:
-        # Combine existing and new data
-        combined_df = pd.concat([existing_ohlc_df, new_ohlc_df])
-        # Remove duplicates (keep the newest instance)
-        combined_df = combined_df[~combined_df.index.duplicated(keep='last')]
+        # Combine existing and new data, the new candles replace the stored ones for the same (date, crypto)
+        combined_df = pd.concat([existing_ohlc_df[~existing_ohlc_df.index.isin(new_ohlc_df.index)], new_ohlc_df])
         print(f"Combined data: {combined_df.shape[0]} records and deleted {existing_ohlc_df.shape[0] + new_ohlc_df.shape[0] - combined_df.shape[0]} duplicates")
     elif not existing_ohlc_df.empty:
         combined_df = existing_ohlc_df
@@ -719,10 +933,12 @@ def get_ohlc_data_with_persistence(assets_in_portfolio, reference_asset="ZEUR",
         combined_df = pd.DataFrame(columns=['price', 'timestamp'])
         combined_df.index = pd.MultiIndex.from_tuples([], names=['date', 'crypto'])
     
-    # Save to parquet file (with timestamp included)
-    if not combined_df.empty:
-        combined_df.to_parquet(filename, engine="fastparquet", compression="GZIP")
+    # Save to parquet file (with timestamp included), only when its content changed
+    if not combined_df.empty and (not new_ohlc_df.empty or not loaded_from_parquet):
+        combined_df.to_parquet(filename, engine="pyarrow", compression="zstd")
         print(f"Saved OHLC data to {filename}")
+    elif not combined_df.empty:
+        print(f"OHLC data unchanged, skipping save to {filename}")
     
     print(f"Combined data: {combined_df.shape[0]} records")
     return combined_df
@@ -745,7 +961,19 @@ def calculate_taxes_with_franchigia(gain, year):
             # Negative gain (loss): tax the amount exceeding 2000 EUR (but this would be negative)
             taxable_amount = gain + 2000
         
-        return taxable_amount * Decimal(0.26)
+        return taxable_amount * CAPITAL_GAINS_TAX_RATE
+
+def calculate_taxes_by_year(gain_by_year):
+    """
+    Calculate the taxes of each year from the total gains indexed by year.
+    The 2024 franchigia is applied to 2024 only, the other years are taxed at the full rate.
+    """
+    return pd.Series(
+        [calculate_taxes_with_franchigia(gain, year) if year == 2024 else gain * CAPITAL_GAINS_TAX_RATE
+         for year, gain in zip(gain_by_year.index, gain_by_year.to_numpy())],
+        index=gain_by_year.index,
+        dtype=object,
+    )
 
 def calculate_italian_crypto_taxes_2025(ledger_df_trade_final, api_key, api_sec, ohlc_df):
     """
@@ -756,7 +984,7 @@ def calculate_italian_crypto_taxes_2025(ledger_df_trade_final, api_key, api_sec,
         balance_df = get_balance_dataframe(api_key, api_sec)
         balance_df = balance_df.reset_index(names=['asset'])
         balance_df = normalize_assets_name(balance_df, "asset")
-        balance_df["balance"] = balance_df.apply(lambda row: decimal_from_value(row["balance"]), axis=1)
+        balance_df["balance"] = [decimal_from_value(value) for value in balance_df["balance"].to_numpy()]
         balance_df = balance_df[["balance","assetnorm"]]
         balance_df = balance_df.groupby(['assetnorm']).sum()
         
@@ -771,11 +999,7 @@ def calculate_italian_crypto_taxes_2025(ledger_df_trade_final, api_key, api_sec,
         gains_by_year = gains_final_df.groupby(['year']).sum()
 
         # Apply taxes with 2024 franchigia
-        gains_by_year["taxes"] = gains_by_year.apply(
-            lambda row: calculate_taxes_with_franchigia(row["gain"], row.name) if row.name == 2024 
-            else row["gain"] * Decimal(0.26), 
-            axis=1
-        )
+        gains_by_year["taxes"] = calculate_taxes_by_year(gains_by_year["gain"])
         
         # Convert DataFrames to JSON-serializable format
         def decimal_to_float(obj):
@@ -828,7 +1052,7 @@ def load_encrypted_credentials():
     """
     Load encrypted API credentials from persistent storage
     """
-    api_file = '/app/persistent_data/config/kraken_api_keys.json'
+    api_file = os.path.join(PERSISTENT_DATA_DIR, 'config', 'kraken_api_keys.json')
     if not os.path.exists(api_file):
         return None, None
     with open(api_file, 'r') as f:
@@ -5,7 +5,6 @@ This script connects to Kraken API, downloads user transactions,
 and computes Italian crypto taxes according to 2025 regulations.
 """
 
-from datetime import datetime
 from dotenv import load_dotenv
 import pandas as pd
 
@@ -26,15 +25,14 @@ def main():
     print("Total number of transactions: " + str(response["result"]["count"]))
     # Get all ledger data
     # Retrive the local copy of the data
-    start_timestamp = datetime.strptime(start_date, "%Y-%m-%d")
     filename = "kraken_ledger.parquet"
     ledger_df = pd.DataFrame([])
     # Read data from file
     try:
-        ledger_df = pd.read_parquet(filename, engine="fastparquet")
+        ledger_df = pd.read_parquet(filename, engine="pyarrow")
         # Update startdate based on the data retrieved from the file
         if ledger_df.shape[0] > 0:
-            ledger_df = ledger_df[ledger_df["date"] > start_date]
+            ledger_df = ledger_df[ledger_df["date"] > pd.Timestamp(start_date)]
             # Update start date to retrieve data from the
             start_timestamp = ledger_df.iloc[0].loc["date"]
             start_date = str(start_timestamp)[:10]
@@ -42,10 +40,10 @@ def main():
         print("No file found")
 
     ledger_df_delta = kraken.retrieve_all_ledger_data(start_date, api_key, api_sec)
-    # Remove duplicated data
-    ledger_df_delta = ledger_df_delta.loc[ledger_df_delta["date"] > start_timestamp]
+    # Remove duplicated data: the delta restarts at the beginning of the last stored day, keep only unseen ledger IDs
+    ledger_df_delta = ledger_df_delta.loc[~ledger_df_delta.index.isin(ledger_df.index)]
     
-    # Ensure both DataFrames have the same structure before concatenation
+    # Prepend the new ledger entries to the stored ones
     if ledger_df.empty:
         # If ledger_df is empty, just use ledger_df_delta
         ledger_df = ledger_df_delta
@@ -53,47 +51,33 @@ def main():
         # If ledger_df_delta is empty, keep ledger_df as is
         pass
     else:
-        # Both have data, ensure they have the same columns and dtypes
-        # Get the union of all columns
-        all_columns = list(set(ledger_df.columns) | set(ledger_df_delta.columns))
-        
-        # Ensure both DataFrames have all columns with consistent dtypes
-        for col in all_columns:
-            if col not in ledger_df.columns:
-                ledger_df[col] = None
-            if col not in ledger_df_delta.columns:
-                ledger_df_delta[col] = None
-        
-        # Reorder columns to match
-        ledger_df = ledger_df[all_columns]
-        ledger_df_delta = ledger_df_delta[all_columns]
-        
-        # Concat data
-        ledger_df = pd.concat([ledger_df_delta, ledger_df], ignore_index=False)
-    # Write back to file
-    ledger_df.to_parquet(filename, engine="fastparquet", compression="GZIP")
+        # Both have data: concat aligns the columns itself (a column missing on one side is filled with NaN)
+        ledger_df = pd.concat([ledger_df_delta, ledger_df], ignore_index=False, sort=False)
+    # Write back to file, only when new ledger entries were downloaded
+    if not ledger_df_delta.empty:
+        ledger_df.to_parquet(filename, engine="pyarrow", compression="zstd")
     # Create columns with decimal value
-    ledger_df["decimalamount"] = ledger_df.apply(lambda row: kraken.decimal_from_value(row["amount"]), axis=1)
-    ledger_df["decimalbalance"] = ledger_df.apply(lambda row: kraken.decimal_from_value(row["balance"]), axis=1)
-    ledger_df["decimalfee"] = ledger_df.apply(lambda row: kraken.decimal_from_value(row["fee"]), axis=1)
+    ledger_df["decimalamount"] = [kraken.decimal_from_value(value) for value in ledger_df["amount"].to_numpy()]
+    ledger_df["decimalbalance"] = [kraken.decimal_from_value(value) for value in ledger_df["balance"].to_numpy()]
+    ledger_df["decimalfee"] = [kraken.decimal_from_value(value) for value in ledger_df["fee"].to_numpy()]
     ledger_df["justdate"] = ledger_df['date'].dt.normalize()
-    ledger_df.dtypes
     ledger_df = kraken.normalize_assets_name(ledger_df, "asset", True)
     assets_in_portofolio = ledger_df["assetnorm"].unique()
     operation_types = ledger_df["type"].unique()
     print(operation_types)
     # Trades - approximate all plus and minus (Staking and Credit Card buys are left behind)
     ledger_df_trade = ledger_df[ledger_df["assetnorm"]!="KFEE"]
-    ledger_df_trade = ledger_df_trade[(ledger_df_trade["type"]=="spend")|(ledger_df_trade["type"]=="receive")|(ledger_df_trade["type"]=="trade")].set_index("refid")
+    ledger_df_trade = ledger_df_trade[ledger_df_trade["type"].isin(["spend", "receive", "trade"])].set_index("refid")
     ledger_df_from = ledger_df_trade[ledger_df_trade["decimalamount"] < 0]
     ledger_df_to = ledger_df_trade[ledger_df_trade["decimalamount"] >= 0]
     ledger_df_trade = ledger_df_from.join(ledger_df_to, how="left", lsuffix="_from", rsuffix="_to")
     ledger_df_trade = ledger_df_trade.sort_values(by=['date_from'], ascending=False)
 
     # Check consistency
-    if ledger_df_trade.index.duplicated().any():
+    duplicated_index = ledger_df_trade.index.duplicated()
+    if duplicated_index.any():
         print("There are duplicate indexes:")
-        print(ledger_df_trade[ledger_df_trade.index.duplicated()])
+        print(ledger_df_trade[duplicated_index])
     else:
         print("No duplicate indexes.")
 
@@ -112,7 +96,13 @@ def main():
 
     # Compute price
     ledger_df_trade_final = pd.concat([ledger_df_trade_sell, ledger_df_trade_buy], ignore_index=False)
-    ledger_df_trade_final["price"] = ledger_df_trade_final["total"]/ledger_df_trade_final["quantity"]*-1
+    # Free intermediate frames
+    del ledger_df_trade, ledger_df_from, ledger_df_to, ledger_df_trade_sell, ledger_df_trade_buy
+    # Missing legs give NaN, zero quantities a zero price
+    ledger_df_trade_final["price"] = [
+        float("nan") if pd.isna(total) or pd.isna(quantity) else -total / quantity if quantity else Decimal(0)
+        for total, quantity in zip(ledger_df_trade_final["total"].to_numpy(), ledger_df_trade_final["quantity"].to_numpy())
+    ]
     ledger_df_trade_final.sort_values(by=['datetime'], ascending=False, inplace=True)
     print(ledger_df_trade_final.shape)
 
@@ -135,7 +125,7 @@ def main():
     balance_df = kraken.get_balance_dataframe(api_key, api_sec)
     balance_df = balance_df.reset_index(names=['asset'])
     balance_df = kraken.normalize_assets_name(balance_df, "asset")
-    balance_df["balance"] = balance_df.apply(lambda row: kraken.decimal_from_value(row["balance"]), axis=1)
+    balance_df["balance"] = [kraken.decimal_from_value(value) for value in balance_df["balance"].to_numpy()]
     balance_df = balance_df[["balance","assetnorm"]]
     balance_df = balance_df.groupby(['assetnorm']).sum()
 
@@ -155,7 +145,8 @@ def main():
     if not gains_final_df.empty:
         print(f"{'Year':<6} {'Asset':<10} {'Initial Value (EUR)':<20} {'Final Value (EUR)':<20} {'Gain/Loss (EUR)':<20} {'Verification':<15}")
         print("-" * 100)
-        
+
+        gains_lines = []
         for _, row in gains_final_df.iterrows():
             year = row['year']
             asset = row['asset']
@@ -167,21 +158,17 @@ def main():
             calculated_gain = final_value - initial_value
             verification = "✓ OK" if abs(gain - calculated_gain) < Decimal('0.01') else "✗ ERROR"
             
-            print(f"{year:<6} {asset:<10} {float(initial_value):<20.2f} {float(final_value):<20.2f} {float(gain):<20.2f} {verification:<15}")
-    
-    # Group by year and asset for tax calculation
-    gains_by_year_asset = gains_final_df.groupby(['year','asset']).sum()
+            gains_lines.append(f"{year:<6} {asset:<10} {float(initial_value):<20.2f} {float(final_value):<20.2f} {float(gain):<20.2f} {verification:<15}")
+
+        # Print the table
+        print("\n".join(gains_lines))
     
     # Group by year only for final tax summary
     gains_by_year = gains_final_df.groupby(['year']).sum()
 
     #Taxes with 2024 franchigia (deductible threshold)
     # Apply franchigia for 2024, normal tax calculation for other years
-    gains_by_year["taxes"] = gains_by_year.apply(
-        lambda row: kraken.calculate_taxes_with_franchigia(row["gain"], row.name) if row.name == 2024 
-        else row["gain"] * Decimal(0.26), 
-        axis=1
-    )
+    gains_by_year["taxes"] = kraken.calculate_taxes_by_year(gains_by_year["gain"])
     
     print("\n" + "="*80)
     print("TAX SUMMARY BY YEAR")